@@ -1,14 +1,73 @@
+import copy
 import os
-import json
+import re
 import sys
+from functools import lru_cache
 from dotenv import load_dotenv
-import google.generativeai as genai
-import google.api_core.exceptions
+
+# Prefer the fastest available JSON backend; all three accept bytes input.
+try:
+    import orjson
+
+    def _json_loads(data):
+        return orjson.loads(data)
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    try:
+        import ujson as _json
+    except ImportError:
+        import json as _json
+
+    def _json_loads(data):
+        return _json.loads(data)
+
+    def _json_dumps(obj):
+        return _json.dumps(obj, indent=2).encode("utf-8")
+
+# ijson is optional and only used to stream unusually large stats files.
+try:
+    import ijson.backends.yajl2_c as _ijson
+    from ijson.common import JSONError as _IJSONError
+except ImportError:
+    _ijson = None
 
 
 # --- Configuration ---
 STATS_FILE = "persona_stats.json"
 MODEL_NAME = "gemini-1.5-flash-latest"
+STREAM_THRESHOLD_BYTES = 1024 * 1024  # Stream-parse stats files larger than this
+
+_STAT_NAMES = ("Knowledge", "Charm", "Guts", "Health", "Kindness")
+_STAT_NAMES_SET = frozenset(_STAT_NAMES)
+_DEFAULT_STATS = {stat: 0 for stat in _STAT_NAMES}
+
+_SYSTEM_PROMPT = """
+You are an AI stat evaluator for a text-based life sim app inspired by Persona 5.
+The app tracks five stats: Knowledge, Charm, Guts, Health, Kindness.
+
+Based on the user's daily log, identify the **two stats** that were most developed.
+Award each of those two stats a point value based on the effort level:
+- 3 points: Outstanding / Expert-level effort
+- 2 points: Solid / Average-level effort
+- 1 point: Beginner / Basic effort
+
+Your output must strictly follow this format, with one stat per line:
+Stat = Points
+Stat = Points
+"""
+_BATCH_SEPARATOR = "---"
+# A separator line holds only dashes; markdown-style rules longer than three count too
+_BATCH_SEPARATOR_RE = re.compile(r'^[^\S\n]*-{3,}[^\S\n]*$', re.MULTILINE)
+
+_display_cache = (None, None)  # (stats items, formatted text) of the last all-int display_stats call
+
+_genai = None  # google.generativeai, imported on first use by _load_genai()
+_MODEL = None  # GenerativeModel shared by every evaluation once the API is configured
+
+# One "Stat = Points" assignment per line; [^\S\n] is whitespace that stays on the line
+_STAT_LINE_RE = re.compile(r'^[^\S\n]*([A-Za-z]+)[^\S\n]*=[^\S\n]*([-+]?\d+)[^\S\n]*$', re.MULTILINE)
 
 
 def main():
@@ -18,7 +77,7 @@ def main():
         return
     
     # Load and display current stats
-    current_stats = load_stats()
+    current_stats, loaded_from_file = _read_stats()
     display_stats(current_stats)
     
     # Get user input
@@ -32,12 +91,18 @@ def main():
         return
     
     # Evaluate with AI and update stats
+    stats_before = dict(current_stats)
     updated_stats = evaluate_and_update_stats(task, current_stats)
     
-    # Save and display final stats
-    save_stats(updated_stats)
+    # Save only if something changed or the file is missing/corrupted, then display final stats
+    stats_changed = updated_stats != stats_before
+    if stats_changed or not loaded_from_file:
+        save_stats(updated_stats)
     display_stats(updated_stats)
-    print("\nSession complete. Your stats have been updated!")
+    if stats_changed:
+        print("\nSession complete. Your stats have been updated!")
+    else:
+        print("\nSession complete. No stats changed.")
 
 
 def initialize_gemini_api():
@@ -54,10 +119,12 @@ def initialize_gemini_api():
         print("Please ensure your .env file contains: GEMINI_API_KEY=\"YOUR_ACTUAL_API_KEY\"")
         return False
     
+    global _MODEL
     try:
+        genai = _load_genai()
         genai.configure(api_key=api_key)
-        # Test model initialization
-        model = genai.GenerativeModel(MODEL_NAME)
+        # Build the model once here; evaluations reuse it
+        _MODEL = genai.GenerativeModel(MODEL_NAME)
         return True
     except Exception as e:
         print(f"Error configuring Gemini API: {e}")
@@ -65,35 +132,91 @@ def initialize_gemini_api():
         return False
 
 
+def _load_genai():
+    """Import google.generativeai on first use and cache the module.
+    
+    The import pulls in grpc and protobuf, so it is deferred until the API
+    is actually needed rather than paid on every import of this module.
+    
+    Returns:
+        module: The google.generativeai module.
+    """
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        _genai = genai
+    return _genai
+
+
+def _get_model():
+    """Return the cached GenerativeModel, creating it if the API was configured elsewhere.
+    
+    Returns:
+        GenerativeModel: The model used for stat evaluation.
+    """
+    global _MODEL
+    if _MODEL is None:
+        _MODEL = _load_genai().GenerativeModel(MODEL_NAME)
+    return _MODEL
+
+
 def load_stats():
     """Load stats from STATS_FILE or initialize them if the file doesn't exist.
     
     Returns:
         dict: Dictionary containing the five persona stats.
     """
-    default_stats = {
-        "Knowledge": 0,
-        "Charm": 0,
-        "Guts": 0,
-        "Health": 0,
-        "Kindness": 0
-    }
-    
-    if os.path.exists(STATS_FILE):
-        try:
-            with open(STATS_FILE, 'r') as f:
-                current_stats = json.load(f)
-                # Ensure all default stats exist in the loaded data
-                for stat, default_val in default_stats.items():
-                    if stat not in current_stats:
-                        current_stats[stat] = default_val
-                return current_stats
-        except (json.JSONDecodeError, IOError):
-            print(f"Warning: {STATS_FILE} is corrupted. Starting with default stats.")
-            return default_stats
-    else:
+    return _read_stats()[0]
+
+
+def _read_stats():
+    """Load stats like load_stats, also reporting whether STATS_FILE supplied them.
+    
+    Returns:
+        tuple: (stats dict, True if read from STATS_FILE or False if the
+            file was missing or corrupted and defaults were used).
+    """
+    try:
+        st = os.stat(STATS_FILE)
+        # Copy so callers can mutate the result without touching the cache
+        current_stats = copy.deepcopy(_cached_load(STATS_FILE, st.st_mtime_ns, st.st_size))
+    except FileNotFoundError:
+        # Raised by stat() or, if the file vanished in between, by open()
         print(f"No existing stats found. Creating {STATS_FILE} with default stats.")
-        return default_stats
+        return _DEFAULT_STATS.copy(), False
+    except (ValueError, IOError):
+        print(f"Warning: {STATS_FILE} is corrupted. Starting with default stats.")
+        return _DEFAULT_STATS.copy(), False
+    
+    # Ensure all default stats exist in the loaded data
+    for stat in _STAT_NAMES:
+        current_stats.setdefault(stat, 0)
+    return current_stats, True
+
+
+@lru_cache(maxsize=1)
+def _cached_load(path, mtime_ns, size):
+    """Read and parse the stats file, memoized on its stat() signature.
+    
+    Args:
+        path (str): Path of the stats file.
+        mtime_ns (int): Modification time of the file, used as a cache key.
+        size (int): Size of the file in bytes, used as a cache key.
+        
+    Returns:
+        dict: The parsed stats, shared between calls. Do not mutate.
+        
+    Raises:
+        ValueError: If the file does not contain valid JSON.
+    """
+    with open(path, 'rb') as f:
+        if _ijson is None or size <= STREAM_THRESHOLD_BYTES:
+            return _json_loads(f.read())
+        try:
+            # use_float keeps non-integers as float rather than Decimal, matching _json_loads
+            return {key: value for key, value in _ijson.kvitems(f, '', use_float=True)}
+        except _IJSONError as e:
+            raise ValueError(str(e)) from e
 
 
 def save_stats(stats):
@@ -106,13 +229,35 @@ def save_stats(stats):
         bool: True if save successful, False otherwise.
     """
     try:
-        with open(STATS_FILE, 'w') as f:
-            json.dump(stats, f, indent=4)
-        print(f"Stats saved to {STATS_FILE}")
-        return True
-    except IOError as e:
+        data = _json_dumps(stats)
+    except (TypeError, ValueError) as e:
+        print(f"Error saving stats to {STATS_FILE}: {e}")
+        return False
+    
+    # Write to a temp file and rename it over STATS_FILE so a crash mid-write
+    # never leaves a truncated stats file behind
+    tmp_file = STATS_FILE + ".tmp"
+    try:
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            written = os.write(fd, data)
+        finally:
+            os.close(fd)
+        if written != len(data):
+            raise OSError(f"short write ({written} of {len(data)} bytes)")
+        os.replace(tmp_file, STATS_FILE)
+    except OSError as e:
+        try:
+            os.unlink(tmp_file)
+        except FileNotFoundError:
+            pass
         print(f"Error saving stats to {STATS_FILE}: {e}")
         return False
+    
+    _cached_load.cache_clear()
+    if sys.stdout.isatty():
+        print(f"Stats saved to {STATS_FILE}")
+    return True
 
 
 def evaluate_and_update_stats(activity_log, current_stats):
@@ -120,40 +265,84 @@ def evaluate_and_update_stats(activity_log, current_stats):
     
     Args:
         activity_log (str): The user's daily activity log.
-        current_stats (dict): Current persona stats.
+        current_stats (dict): Current persona stats, updated in place.
         
     Returns:
-        dict: Updated stats dictionary.
+        dict: current_stats, updated with any points awarded.
     """
-    system_prompt = """
-    You are an AI stat evaluator for a text-based life sim app inspired by Persona 5.
-    The app tracks five stats: Knowledge, Charm, Guts, Health, Kindness.
-
-    Based on the user's daily log, identify the **two stats** that were most developed.
-    Award each of those two stats a point value based on the effort level:
-    - 3 points: Outstanding / Expert-level effort
-    - 2 points: Solid / Average-level effort
-    - 1 point: Beginner / Basic effort
-
-    Your output must strictly follow this format, with one stat per line:
-    Stat = Points
-    Stat = Points
+    print("\n--- Sending log to AI for evaluation... ---")
+    
+    return _run_evaluation(
+        f"{_SYSTEM_PROMPT}\nUser log: {activity_log}",
+        current_stats,
+        parse_and_apply_stat_updates,
+    )
+
+
+def evaluate_and_update_stats_batch(activity_logs, current_stats):
+    """Evaluate several activity logs with a single AI request and update stats.
+    
+    All logs are sent in one prompt so the network round trip is paid once.
+    The AI is asked to separate its evaluation of each log with a
+    _BATCH_SEPARATOR line, and each block is applied in turn.
+    
+    Args:
+        activity_logs (list[str]): The user's activity logs, one per day.
+        current_stats (dict): Current persona stats, updated in place.
+        
+    Returns:
+        dict: current_stats, updated with any points awarded.
     """
+    if not activity_logs:
+        print("No activity logs to evaluate.")
+        return current_stats
     
-    print("\n--- Sending log to AI for evaluation... ---")
+    numbered_logs = "\n".join(f"Log {i}: {log}" for i, log in enumerate(activity_logs, 1))
+    prompt = (
+        f"{_SYSTEM_PROMPT}\n"
+        f"Evaluate each of the following {len(activity_logs)} logs separately, in order.\n"
+        f"Separate the output for each log with a line containing only '{_BATCH_SEPARATOR}'.\n"
+        f"{numbered_logs}"
+    )
+    
+    def apply_blocks(ai_output, stats):
+        # A separator before the first or after the last block leaves an empty block
+        blocks = [block for block in _BATCH_SEPARATOR_RE.split(ai_output) if block.strip()]
+        if len(blocks) != len(activity_logs):
+            print(f"Warning: Expected {len(activity_logs)} evaluations but got {len(blocks)}.")
+        for block in blocks:
+            parse_and_apply_stat_updates(block, stats)
+        return stats
+    
+    print(f"\n--- Sending {len(activity_logs)} logs to AI for evaluation... ---")
+    
+    return _run_evaluation(prompt, current_stats, apply_blocks)
+
+
+def _run_evaluation(prompt, current_stats, apply_output):
+    """Send a prompt to the model, show its reply, and apply it to the stats.
+    
+    Args:
+        prompt (str): The full prompt to send.
+        current_stats (dict): Current persona stats, updated in place.
+        apply_output (callable): Called as apply_output(ai_output, current_stats)
+            to apply the model's reply; its result is returned.
+        
+    Returns:
+        dict: current_stats, unchanged if the request failed.
+    """
+    import google.api_core.exceptions
     
     try:
-        model = genai.GenerativeModel(MODEL_NAME)
-        response = model.generate_content(f"{system_prompt}\nUser log: {activity_log}")
+        model = _get_model()
+        response = model.generate_content(prompt)
         raw_ai_output = response.text.strip()
         
         print("\n--- AI Evaluation Result ---")
         print(raw_ai_output)
         print("--------------------------")
         
-        # Parse and apply stat updates
-        updated_stats = parse_and_apply_stat_updates(raw_ai_output, current_stats.copy())
-        return updated_stats
+        return apply_output(raw_ai_output, current_stats)
         
     except google.api_core.exceptions.ClientError as e:
         print(f"\nAn API error occurred: {e}")
@@ -169,32 +358,41 @@ def parse_and_apply_stat_updates(ai_output, stats):
     
     Args:
         ai_output (str): Raw output from AI evaluation.
-        stats (dict): Current stats dictionary to update.
+        stats (dict): Current stats dictionary, updated in place.
         
     Returns:
-        dict: Updated stats dictionary.
+        dict: The same stats dictionary.
     """
-    lines = ai_output.split('\n')
+    # Explanation-only responses contain no assignments at all
+    if '=' not in ai_output:
+        print("No valid stat updates were parsed from AI's response.")
+        return stats
+    
     updated_any_stat = False
+    matched_chars = 0
     
-    for line in lines:
-        line = line.strip()
-        if '=' in line:
-            try:
-                stat_name, points_str = line.split('=', 1)
-                stat_name = stat_name.strip()
-                points = int(points_str.strip())
-                
-                if stat_name in stats:
-                    stats[stat_name] += points
-                    print(f"Updated {stat_name}: +{points} points.")
-                    updated_any_stat = True
-                else:
-                    print(f"Warning: AI suggested unknown stat '{stat_name}'. Skipping.")
-            except ValueError:
-                print(f"Warning: Could not parse line '{line}'. Skipping.")
+    for match in _STAT_LINE_RE.finditer(ai_output):
+        stat_name, points = match.group(1), int(match.group(2))
+        matched_chars += match.end() - match.start()
+        
+        if stat_name in _STAT_NAMES_SET:
+            stats[stat_name] = stats.get(stat_name, 0) + points
+            print(f"Updated {stat_name}: +{points} points.")
+            updated_any_stat = True
         else:
-            if line:  # Only print if line is not empty
+            print(f"Warning: AI suggested unknown stat '{stat_name}'. Skipping.")
+    
+    # Only walk the lines again if some of the output was not a stat assignment
+    if matched_chars + ai_output.count('\n') < len(ai_output):
+        # Split on '\n' only, the same line boundary _STAT_LINE_RE uses; model
+        # output is rarely indented, so only trailing whitespace is trimmed
+        for line in ai_output.split('\n'):
+            line = line.rstrip()
+            if not line or _STAT_LINE_RE.match(line):
+                continue
+            if '=' in line:
+                print(f"Warning: Could not parse line '{line}'. Skipping.")
+            else:
                 print(f"Info: {line}")
     
     if not updated_any_stat:
@@ -209,10 +407,16 @@ def display_stats(stats):
     Args:
         stats (dict): Dictionary containing the persona stats to display.
     """
-    print("\n--- Current Persona Stats ---")
-    for stat, value in stats.items():
-        print(f"{stat}: {value}")
-    print("---------------------------")
+    global _display_cache
+    key = tuple(stats.items())
+    # Only int values are safe to key on; a mutable value could change in place
+    cacheable = all(type(value) is int for _, value in key)
+    cached_key, text = _display_cache
+    if not cacheable or key != cached_key:
+        body = "\n".join(f"{stat}: {value}" for stat, value in key)
+        text = f"\n--- Current Persona Stats ---\n{body}\n---------------------------"
+        _display_cache = (key, text) if cacheable else (None, None)
+    print(text)
 
 
 def handle_api_error(error):
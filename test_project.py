@@ -1,17 +1,32 @@
 import pytest
 import json
 import os
+import subprocess
+import sys
 import tempfile
 from unittest.mock import patch, mock_open, MagicMock
-from project import load_stats, save_stats, parse_and_apply_stat_updates, display_stats, handle_api_error, initialize_gemini_api
+import project
+from project import main, load_stats, save_stats, parse_and_apply_stat_updates, display_stats, handle_api_error, initialize_gemini_api, evaluate_and_update_stats, evaluate_and_update_stats_batch
+
+
+def fake_stat(mtime_ns=1, size=100):
+    """Build a stand-in for os.stat() results used as the load cache key."""
+    return MagicMock(st_mtime_ns=mtime_ns, st_size=size)
 
 
 class TestLoadStats:
     """Test cases for the load_stats function."""
     
+    @pytest.fixture(autouse=True)
+    def clear_load_cache(self):
+        """Ensure each test starts with an empty load_stats cache."""
+        project._cached_load.cache_clear()
+        yield
+        project._cached_load.cache_clear()
+    
     def test_load_stats_default_when_file_missing(self):
         """Test loading default stats when file doesn't exist."""
-        with patch('os.path.exists', return_value=False):
+        with patch('os.stat', side_effect=FileNotFoundError):
             stats = load_stats()
             expected = {
                 "Knowledge": 0,
@@ -22,6 +37,16 @@ class TestLoadStats:
             }
             assert stats == expected
     
+    def test_load_stats_default_when_open_finds_no_file(self):
+        """Test that a file removed between stat() and open() falls back to defaults."""
+        with patch('os.stat', return_value=fake_stat()):
+            with patch('builtins.open', side_effect=FileNotFoundError):
+                with patch('builtins.print') as mock_print:
+                    stats = load_stats()
+        
+        assert stats == {"Knowledge": 0, "Charm": 0, "Guts": 0, "Health": 0, "Kindness": 0}
+        assert "No existing stats found" in mock_print.call_args[0][0]
+    
     def test_load_stats_from_existing_file(self):
         """Test loading stats from an existing valid file."""
         test_stats = {
@@ -32,15 +57,16 @@ class TestLoadStats:
             "Kindness": 1
         }
         
-        with patch('os.path.exists', return_value=True):
-            with patch('builtins.open', mock_open(read_data=json.dumps(test_stats))):
+        with patch('os.stat', return_value=fake_stat()):
+            with patch('builtins.open', mock_open(read_data=json.dumps(test_stats).encode())) as mock_file:
                 stats = load_stats()
                 assert stats == test_stats
+                mock_file.assert_called_once_with('persona_stats.json', 'rb')
     
     def test_load_stats_corrupted_file(self):
         """Test loading stats when file is corrupted."""
-        with patch('os.path.exists', return_value=True):
-            with patch('builtins.open', mock_open(read_data="invalid json")):
+        with patch('os.stat', return_value=fake_stat()):
+            with patch('builtins.open', mock_open(read_data=b"invalid json")):
                 stats = load_stats()
                 expected = {
                     "Knowledge": 0,
@@ -58,14 +84,57 @@ class TestLoadStats:
             "Charm": 3
         }
         
-        with patch('os.path.exists', return_value=True):
-            with patch('builtins.open', mock_open(read_data=json.dumps(incomplete_stats))):
+        with patch('os.stat', return_value=fake_stat()):
+            with patch('builtins.open', mock_open(read_data=json.dumps(incomplete_stats).encode())):
                 stats = load_stats()
                 assert stats["Knowledge"] == 5
                 assert stats["Charm"] == 3
                 assert stats["Guts"] == 0
                 assert stats["Health"] == 0
                 assert stats["Kindness"] == 0
+    
+    def test_load_stats_default_is_fresh_copy(self):
+        """Test that mutating returned default stats does not leak into later calls."""
+        with patch('os.stat', side_effect=FileNotFoundError):
+            stats = load_stats()
+            stats["Knowledge"] = 10
+            assert load_stats()["Knowledge"] == 0
+    
+    def test_load_stats_cached_until_file_changes(self):
+        """Test that the file is only re-read when its stat signature changes."""
+        test_stats = {"Knowledge": 5, "Charm": 3, "Guts": 2, "Health": 4, "Kindness": 1}
+        
+        with patch('builtins.open', mock_open(read_data=json.dumps(test_stats).encode())) as mock_file:
+            with patch('os.stat', return_value=fake_stat()):
+                first = load_stats()
+                first["Knowledge"] = 99  # Mutating the result must not poison the cache
+                second = load_stats()
+            assert mock_file.call_count == 1
+            assert second == test_stats
+            
+            with patch('os.stat', return_value=fake_stat(mtime_ns=2)):
+                load_stats()
+            assert mock_file.call_count == 2
+    
+    @pytest.mark.skipif(project._ijson is None, reason="ijson yajl2_c backend not installed")
+    def test_load_stats_streams_large_file(self, tmp_path):
+        """Test that files above the threshold are stream-parsed with ijson."""
+        test_stats = {"Knowledge": 5, "Charm": 3, "History": [1, 2, 3], "Avg": 1.5}
+        stats_file = tmp_path / "stats.json"
+        stats_file.write_text(json.dumps(test_stats))
+        
+        with patch('project.STATS_FILE', str(stats_file)):
+            with patch('project.STREAM_THRESHOLD_BYTES', 0):
+                with patch.object(project._ijson, 'kvitems', wraps=project._ijson.kvitems) as kvitems:
+                    stats = load_stats()
+                    kvitems.assert_called_once()
+                    assert stats["Knowledge"] == 5
+                    assert stats["History"] == [1, 2, 3]
+                    assert stats["Guts"] == 0
+                    assert type(stats["Avg"]) is float
+                    assert save_stats(stats) is True
+        
+        assert json.loads(stats_file.read_text())["Avg"] == 1.5
 
 
 class TestSaveStats:
@@ -81,18 +150,64 @@ class TestSaveStats:
             "Kindness": 1
         }
         
-        with patch('builtins.open', mock_open()) as mock_file:
-            result = save_stats(test_stats)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stats_file = os.path.join(tmp_dir, "persona_stats.json")
+            with patch('project.STATS_FILE', stats_file):
+                result = save_stats(test_stats)
             assert result is True
-            mock_file.assert_called_once_with('persona_stats.json', 'w')
+            with open(stats_file) as f:
+                assert json.load(f) == test_stats
+            assert not os.path.exists(stats_file + ".tmp")
     
     def test_save_stats_failure(self):
         """Test saving stats when file operation fails."""
         test_stats = {"Knowledge": 5}
         
-        with patch('builtins.open', side_effect=IOError("Permission denied")):
+        with patch('os.open', side_effect=IOError("Permission denied")):
             result = save_stats(test_stats)
             assert result is False
+    
+    def test_save_stats_keeps_old_file_on_failure(self):
+        """Test that a failed write leaves the existing stats file intact."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stats_file = os.path.join(tmp_dir, "persona_stats.json")
+            with open(stats_file, 'w') as f:
+                json.dump({"Knowledge": 1}, f)
+            
+            with patch('project.STATS_FILE', stats_file):
+                with patch('os.write', side_effect=OSError("Disk full")):
+                    result = save_stats({"Knowledge": 5})
+            
+            assert result is False
+            with open(stats_file) as f:
+                assert json.load(f) == {"Knowledge": 1}
+            assert not os.path.exists(stats_file + ".tmp")
+    
+    def test_save_stats_short_write(self):
+        """Test that a partial write is reported and not renamed over the stats file."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stats_file = os.path.join(tmp_dir, "persona_stats.json")
+            with open(stats_file, 'w') as f:
+                json.dump({"Knowledge": 1}, f)
+            
+            with patch('project.STATS_FILE', stats_file):
+                with patch('os.write', return_value=1):
+                    result = save_stats({"Knowledge": 5})
+            
+            assert result is False
+            with open(stats_file) as f:
+                assert json.load(f) == {"Knowledge": 1}
+            assert not os.path.exists(stats_file + ".tmp")
+    
+    def test_save_stats_unserializable(self):
+        """Test that stats which cannot be serialized are reported, not raised."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stats_file = os.path.join(tmp_dir, "persona_stats.json")
+            with patch('project.STATS_FILE', stats_file):
+                result = save_stats({"Knowledge": object()})
+            
+            assert result is False
+            assert not os.path.exists(stats_file + ".tmp")
 
 
 class TestParseAndApplyStatUpdates:
@@ -161,10 +276,11 @@ class TestParseAndApplyStatUpdates:
             "Kindness": 1
         }
         
-        with patch('builtins.print'):
+        with patch('builtins.print') as mock_print:
             updated_stats = parse_and_apply_stat_updates(ai_output, initial_stats)
             
         assert updated_stats == initial_stats  # No changes
+        mock_print.assert_called_once_with("No valid stat updates were parsed from AI's response.")
     
     def test_parse_mixed_valid_invalid(self):
         """Test parsing output with mix of valid and invalid lines."""
@@ -183,6 +299,53 @@ class TestParseAndApplyStatUpdates:
         assert updated_stats["Knowledge"] == 7
         assert updated_stats["Charm"] == 4
         assert updated_stats["Guts"] == 2  # Unchanged
+    
+    def test_parse_known_stat_missing_from_dict(self):
+        """Test that a known stat absent from the dict is added rather than skipped."""
+        ai_output = "Guts = 2\nExtra = 1"
+        initial_stats = {"Knowledge": 5, "Extra": 0}
+        
+        with patch('builtins.print'):
+            updated_stats = parse_and_apply_stat_updates(ai_output, initial_stats)
+            
+        assert updated_stats["Guts"] == 2
+        assert updated_stats["Extra"] == 0  # Not one of the five stats
+    
+    def test_parse_unapplied_line_is_reported(self):
+        """Test that a line the regex did not apply is warned about, not silently skipped."""
+        ai_output = "Knowledge = 2\rCharm = 1"
+        initial_stats = {
+            "Knowledge": 5,
+            "Charm": 3,
+            "Guts": 2,
+            "Health": 4,
+            "Kindness": 1
+        }
+        
+        with patch('builtins.print') as mock_print:
+            updated_stats = parse_and_apply_stat_updates(ai_output, initial_stats)
+        
+        assert updated_stats["Knowledge"] == 5
+        assert updated_stats["Charm"] == 3
+        assert any("Could not parse line" in str(call) for call in mock_print.call_args_list)
+    
+    def test_parse_whitespace_and_crlf(self):
+        """Test parsing output with padded lines and Windows line endings."""
+        ai_output = "  Knowledge=2  \r\n\r\nCharm =  1\r\n"
+        initial_stats = {
+            "Knowledge": 5,
+            "Charm": 3,
+            "Guts": 2,
+            "Health": 4,
+            "Kindness": 1
+        }
+        
+        with patch('builtins.print') as mock_print:
+            updated_stats = parse_and_apply_stat_updates(ai_output, initial_stats)
+            
+        assert updated_stats["Knowledge"] == 7
+        assert updated_stats["Charm"] == 4
+        assert not any("Warning" in str(call) for call in mock_print.call_args_list)
 
 
 class TestDisplayStats:
@@ -202,11 +365,41 @@ class TestDisplayStats:
             display_stats(test_stats)
             
         # Check that print was called with expected content
-        calls = mock_print.call_args_list
-        assert len(calls) == 7  # Header + 5 stats + footer
-        assert "Current Persona Stats" in calls[0][0][0]
-        assert "Knowledge: 5" in calls[1][0][0]
-        assert "Charm: 3" in calls[2][0][0]
+        mock_print.assert_called_once()  # Header, stats and footer in one write
+        output = mock_print.call_args[0][0]
+        lines = output.split("\n")
+        assert "Current Persona Stats" in lines[1]
+        assert lines[2] == "Knowledge: 5"
+        assert lines[3] == "Charm: 3"
+        assert lines[-1].startswith("---")
+    
+    def test_display_stats_reflects_changes(self):
+        """Test that repeated calls reuse or rebuild the output as stats change."""
+        test_stats = {"Knowledge": 5, "Charm": 3}
+        
+        with patch('builtins.print') as mock_print:
+            display_stats(test_stats)
+            display_stats(dict(test_stats))
+            test_stats["Charm"] = 4
+            display_stats(test_stats)
+            
+        first, second, third = (call[0][0] for call in mock_print.call_args_list)
+        assert first == second
+        assert "Charm: 3" in first
+        assert "Charm: 4" in third
+    
+    def test_display_stats_reflects_in_place_list_changes(self):
+        """Test that mutating a list value in place is shown on the next call."""
+        test_stats = {"Knowledge": 1, "History": [1]}
+        
+        with patch('builtins.print') as mock_print:
+            display_stats(test_stats)
+            test_stats["History"].append(2)
+            display_stats(test_stats)
+            
+        first, second = (call[0][0] for call in mock_print.call_args_list)
+        assert "History: [1]" in first
+        assert "History: [1, 2]" in second
 
 
 class TestHandleApiError:
@@ -241,32 +434,239 @@ class TestHandleApiError:
         assert any("model" in str(call) and "no longer be available" in str(call) for call in calls)
 
 
+@pytest.fixture
+def reset_model():
+    """Clear the cached GenerativeModel before and after a test."""
+    project._MODEL = None
+    yield
+    project._MODEL = None
+
+
+@pytest.fixture
+def mock_gemini_env(monkeypatch, reset_model):
+    """Provide an API key and a mocked genai module without touching .env."""
+    mock_genai = MagicMock()
+    monkeypatch.setattr("project.load_dotenv", lambda: None)
+    monkeypatch.setenv("GEMINI_API_KEY", "test_api_key")
+    monkeypatch.setattr(project, "_genai", mock_genai)
+    yield mock_genai
+
+
 class TestInitializeGeminiApi:
     """Test cases for the initialize_gemini_api function."""
     
-    def test_initialize_missing_api_key(self):
+    def test_initialize_missing_api_key(self, mock_gemini_env, monkeypatch):
         """Test initialization when API key is missing."""
-        with patch('project.load_dotenv'):
-            with patch('os.getenv', return_value=None):
-                result = initialize_gemini_api()
-                assert result is False
+        monkeypatch.delenv("GEMINI_API_KEY")
+        result = initialize_gemini_api()
+        assert result is False
+        mock_gemini_env.configure.assert_not_called()
     
-    def test_initialize_api_success(self):
+    def test_initialize_api_success(self, mock_gemini_env):
         """Test successful API initialization."""
-        with patch('project.load_dotenv'):
-            with patch('os.getenv', return_value='test_api_key'):
-                with patch('project.genai.configure'):
-                    with patch('project.genai.GenerativeModel'):
-                        result = initialize_gemini_api()
-                        assert result is True
-    
-    def test_initialize_api_failure(self):
+        result = initialize_gemini_api()
+        assert result is True
+        mock_gemini_env.configure.assert_called_once_with(api_key="test_api_key")
+        assert project._MODEL is mock_gemini_env.GenerativeModel.return_value
+    
+    def test_initialize_api_failure(self, mock_gemini_env):
         """Test API initialization failure."""
-        with patch('project.load_dotenv'):
-            with patch('os.getenv', return_value='invalid_key'):
-                with patch('project.genai.configure', side_effect=Exception("Invalid API key")):
-                    result = initialize_gemini_api()
-                    assert result is False
+        mock_gemini_env.configure.side_effect = Exception("Invalid API key")
+        result = initialize_gemini_api()
+        assert result is False
+    
+    def test_genai_not_imported_until_needed(self):
+        """Test that importing project does not import google.generativeai."""
+        code = "import sys, project; sys.exit('google.generativeai' in sys.modules)"
+        result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)))
+        assert result.returncode == 0
+
+
+@pytest.mark.usefixtures("reset_model")
+class TestEvaluateAndUpdateStats:
+    """Test cases for the evaluate_and_update_stats function."""
+    
+    def test_evaluate_reuses_cached_model(self):
+        """Test that evaluations reuse the model built during initialization."""
+        initial_stats = {
+            "Knowledge": 5,
+            "Charm": 3,
+            "Guts": 2,
+            "Health": 4,
+            "Kindness": 1
+        }
+        
+        with patch.object(project, '_genai') as mock_genai:
+            mock_genai.GenerativeModel.return_value.generate_content.return_value.text = "Knowledge = 2\nCharm = 1"
+            with patch('builtins.print'):
+                evaluate_and_update_stats("Studied for exams", dict(initial_stats))
+                updated_stats = evaluate_and_update_stats("Studied again", dict(initial_stats))
+        
+        mock_genai.GenerativeModel.assert_called_once_with(project.MODEL_NAME)
+        assert updated_stats["Knowledge"] == 7
+        assert updated_stats["Charm"] == 4
+    
+    def test_evaluate_prompt_uses_system_prompt(self):
+        """Test that the request is the shared system prompt followed by the log."""
+        with patch.object(project, '_genai') as mock_genai:
+            generate_content = mock_genai.GenerativeModel.return_value.generate_content
+            generate_content.return_value.text = "Knowledge = 1"
+            with patch('builtins.print'):
+                evaluate_and_update_stats("Read a book", {"Knowledge": 0})
+        
+        generate_content.assert_called_once_with(f"{project._SYSTEM_PROMPT}\nUser log: Read a book")
+    
+    def test_evaluate_updates_stats_in_place(self):
+        """Test that the caller's stats dict is updated and returned."""
+        initial_stats = {"Knowledge": 5, "Charm": 3}
+        
+        with patch.object(project, '_genai') as mock_genai:
+            mock_genai.GenerativeModel.return_value.generate_content.return_value.text = "Knowledge = 2"
+            with patch('builtins.print'):
+                updated_stats = evaluate_and_update_stats("Studied", initial_stats)
+        
+        assert updated_stats is initial_stats
+        assert initial_stats["Knowledge"] == 7
+    
+    def test_system_prompt_lists_every_stat(self):
+        """Test that the system prompt names all of the tracked stats."""
+        for stat in project._STAT_NAMES:
+            assert stat in project._SYSTEM_PROMPT
+
+
+@pytest.mark.usefixtures("reset_model")
+class TestEvaluateAndUpdateStatsBatch:
+    """Test cases for the evaluate_and_update_stats_batch function."""
+    
+    def test_batch_single_request_applies_each_block(self):
+        """Test that several logs are evaluated with one request."""
+        initial_stats = {
+            "Knowledge": 5,
+            "Charm": 3,
+            "Guts": 2,
+            "Health": 4,
+            "Kindness": 1
+        }
+        ai_output = "Knowledge = 2\nCharm = 1\n---\nGuts = 3\nKnowledge = 1"
+        
+        with patch.object(project, '_genai') as mock_genai:
+            generate_content = mock_genai.GenerativeModel.return_value.generate_content
+            generate_content.return_value.text = ai_output
+            with patch('builtins.print'):
+                updated_stats = evaluate_and_update_stats_batch(["Studied", "Went climbing"], initial_stats)
+        
+        generate_content.assert_called_once()
+        prompt = generate_content.call_args[0][0]
+        assert "Log 1: Studied" in prompt
+        assert "Log 2: Went climbing" in prompt
+        assert updated_stats["Knowledge"] == 8
+        assert updated_stats["Charm"] == 4
+        assert updated_stats["Guts"] == 5
+    
+    def test_batch_splits_on_whole_separator_lines(self):
+        """Test that only lines made of dashes separate evaluation blocks."""
+        initial_stats = {"Knowledge": 5, "Charm": 3, "Guts": 2, "Health": 4, "Kindness": 1}
+        ai_output = "Knowledge = 2\n----\nCharm = 1 --- Guts = 1"
+        
+        with patch.object(project, '_genai') as mock_genai:
+            mock_genai.GenerativeModel.return_value.generate_content.return_value.text = ai_output
+            with patch('builtins.print') as mock_print:
+                updated_stats = evaluate_and_update_stats_batch(["Studied", "Went out"], initial_stats)
+        
+        printed = [call[0][0] for call in mock_print.call_args_list]
+        assert updated_stats["Knowledge"] == 7
+        assert updated_stats["Charm"] == 3  # Malformed line is not split into updates
+        assert updated_stats["Guts"] == 2
+        assert "Info: -" not in printed
+        assert not any(line.startswith("Warning: Expected") for line in printed)
+    
+    @pytest.mark.parametrize("ai_output", [
+        "---\nKnowledge = 2\n---\nGuts = 3",
+        "Knowledge = 2\n---\nGuts = 3\n---",
+        "---\nKnowledge = 2\n---\nGuts = 3\n---\n",
+    ])
+    def test_batch_ignores_leading_and_trailing_separators(self, ai_output):
+        """Test that separators around the blocks do not create empty evaluations."""
+        initial_stats = {"Knowledge": 5, "Charm": 3, "Guts": 2, "Health": 4, "Kindness": 1}
+        
+        with patch.object(project, '_genai') as mock_genai:
+            mock_genai.GenerativeModel.return_value.generate_content.return_value.text = ai_output
+            with patch('builtins.print') as mock_print:
+                updated_stats = evaluate_and_update_stats_batch(["Studied", "Went climbing"], initial_stats)
+        
+        printed = [call[0][0] for call in mock_print.call_args_list]
+        assert updated_stats["Knowledge"] == 7
+        assert updated_stats["Guts"] == 5
+        assert not any(line.startswith("Warning: Expected") for line in printed)
+        assert "No valid stat updates were parsed from AI's response." not in printed
+    
+    def test_batch_empty_logs_skips_request(self):
+        """Test that an empty batch returns the stats without calling the API."""
+        initial_stats = {"Knowledge": 0, "Charm": 0, "Guts": 0, "Health": 0, "Kindness": 0}
+        
+        with patch.object(project, '_genai') as mock_genai:
+            generate_content = mock_genai.GenerativeModel.return_value.generate_content
+            generate_content.return_value.text = "Knowledge = 1"
+            with patch('builtins.print'):
+                updated_stats = evaluate_and_update_stats_batch([], initial_stats)
+        
+        generate_content.assert_not_called()
+        assert updated_stats == {"Knowledge": 0, "Charm": 0, "Guts": 0, "Health": 0, "Kindness": 0}
+    
+    def test_batch_api_failure_returns_original_stats(self):
+        """Test that a failed request leaves the stats unchanged."""
+        initial_stats = {"Knowledge": 5, "Charm": 3, "Guts": 2, "Health": 4, "Kindness": 1}
+        
+        with patch.object(project, '_genai') as mock_genai:
+            mock_genai.GenerativeModel.return_value.generate_content.side_effect = Exception("Network down")
+            with patch('builtins.print'):
+                updated_stats = evaluate_and_update_stats_batch(["Studied"], initial_stats)
+        
+        assert updated_stats == initial_stats
+
+
+class TestMain:
+    """Test cases for the main function."""
+    
+    @pytest.fixture
+    def session(self, monkeypatch):
+        """Run main with the API, stats file and user input stubbed out."""
+        stats = {"Knowledge": 5, "Charm": 3, "Guts": 2, "Health": 4, "Kindness": 1}
+        mock_save = MagicMock(return_value=True)
+        monkeypatch.setattr("project.initialize_gemini_api", lambda: True)
+        monkeypatch.setattr("project._read_stats", lambda: (stats, True))
+        monkeypatch.setattr("project.save_stats", mock_save)
+        monkeypatch.setattr("builtins.input", lambda prompt: "Studied all day")
+        monkeypatch.setattr("builtins.print", lambda *args, **kwargs: None)
+        yield mock_save
+    
+    def test_main_saves_changed_stats(self, session):
+        """Test that main saves the stats when the evaluation changed them."""
+        def evaluate(task, stats):
+            stats = dict(stats)
+            stats["Knowledge"] += 2
+            return stats
+        
+        with patch('project.evaluate_and_update_stats', side_effect=evaluate):
+            main()
+        
+        session.assert_called_once()
+        assert session.call_args[0][0]["Knowledge"] == 7
+    
+    def test_main_skips_save_when_unchanged(self, session):
+        """Test that main does not rewrite the stats file when nothing changed."""
+        with patch('project.evaluate_and_update_stats', side_effect=lambda task, stats: stats):
+            main()
+        
+        session.assert_not_called()
+    
+    def test_main_saves_defaults_when_file_unusable(self, session, monkeypatch):
+        """Test that main writes the stats file when load_stats fell back to defaults."""
+        monkeypatch.setattr("project._read_stats", lambda: (dict(project._DEFAULT_STATS), False))
+        with patch('project.evaluate_and_update_stats', side_effect=lambda task, stats: stats):
+            main()
+        
+        session.assert_called_once_with(project._DEFAULT_STATS)
 
 
 if __name__ == "__main__":